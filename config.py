@@ -0,0 +1,33 @@
+import os
+from types import SimpleNamespace
+from functools import lru_cache
+from dotenv import load_dotenv
+
+# The .env file lives next to the code; deployed containers usually get
+# their environment from the platform and ship without one
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+
+
+@lru_cache(maxsize=1)
+def get_config() -> SimpleNamespace:
+    """
+    Load the .env file (if present) and read all settings, once per process,
+    on first use rather than as an import side effect.
+    """
+    if os.path.exists(ENV_FILE):
+        load_dotenv(ENV_FILE)
+
+    return SimpleNamespace(
+        # OpenAI
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        # Shared request/token budget for generation calls (set to the account's limits)
+        openai_max_requests_per_minute=float(os.getenv("OPENAI_MAX_REQUESTS_PER_MINUTE", "500")),
+        openai_max_tokens_per_minute=float(os.getenv("OPENAI_MAX_TOKENS_PER_MINUTE", "200000")),
+        # AWS
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        aws_region=os.getenv("AWS_REGION", "us-east-1"),
+        s3_bucket_name=os.getenv("S3_BUCKET_NAME"),
+        # Request-path logging is quiet by default
+        log_level=os.getenv("LOG_LEVEL", "WARNING").upper()
+    )
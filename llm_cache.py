@@ -0,0 +1,63 @@
+import time
+import logging
+from botocore.exceptions import ClientError
+from config import get_config
+from s3_uploader import get_s3_client
+
+logger = logging.getLogger(__name__)
+
+# Persistent exact-match cache of generated websites, stored next to the
+# uploaded sites in the same bucket. Survives restarts and is shared by all
+# workers, unlike the in-process caches in query_chatgpt. Entries are keyed
+# by query_chatgpt's request hash (model, effort and full prompt), so a prompt
+# or model change never serves pages generated for the old one.
+CACHE_PREFIX = "cache/"
+# Older entries are treated as misses; an S3 lifecycle rule on CACHE_PREFIX
+# (see README) deletes them
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60  # 7 days
+
+
+def _s3_key(key: str) -> str:
+    return f"{CACHE_PREFIX}{key}.html"
+
+
+def get(key: str):
+    """
+    Return the cached HTML for a key, or None on a miss or an expired entry.
+    Cache errors are logged and treated as misses so generation can still go
+    ahead.
+    """
+    bucket = get_config().s3_bucket_name
+    if not bucket:
+        return None
+    try:
+        response = get_s3_client().get_object(Bucket=bucket, Key=_s3_key(key))
+        if time.time() - response['LastModified'].timestamp() > CACHE_TTL_SECONDS:
+            response['Body'].close()
+            return None
+        return response['Body'].read().decode('utf-8')
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+            logger.warning("S3 cache read failed: %s", e)
+        return None
+    except Exception as e:
+        logger.warning("S3 cache read failed: %s", e)
+        return None
+
+
+def put(key: str, html_content: str) -> None:
+    """
+    Store generated HTML under a key. Failures are logged, never raised.
+    """
+    bucket = get_config().s3_bucket_name
+    if not bucket:
+        return
+    try:
+        get_s3_client().put_object(
+            Bucket=bucket,
+            Key=_s3_key(key),
+            Body=html_content.encode('utf-8'),
+            ContentType='text/html'
+        )
+    except Exception as e:
+        logger.warning("S3 cache write failed: %s", e)
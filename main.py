@@ -1,48 +1,69 @@
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse
-from pydantic import BaseModel, Field
-import re
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse, ORJSONResponse
+import asyncio
+import logging
 from datetime import datetime
+from contextlib import asynccontextmanager
 from pathlib import Path
-from query_chatgpt import create_prompt_from_parameters, query_chatgpt_function, validate_html
-from s3_uploader import upload_html_to_s3, check_s3_configuration, list_uploaded_files
+from query_chatgpt import create_prompt_from_parameters, query_chatgpt_function, stream_chatgpt, validate_html, get_cache_stats
+from s3_uploader import upload_html_to_s3, check_s3_configuration, list_uploaded_files, presign_url, sanitize_company_name, UPLOAD_PREFIX
+from schemas import BrandingRequest
+from config import get_config
 
-app = FastAPI(title="Brand Content Generator API")
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Configure logging when the server starts rather than when main is
+    imported, so importing the app does not read .env or any settings.
+    """
+    # Request-path logging is quiet by default; set LOG_LEVEL=INFO or DEBUG for detail
+    logging.basicConfig(level=get_config().log_level)
+    yield
+
+
+app = FastAPI(title="Brand Content Generator API", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Crear directorio para guardar archivos HTML si no existe
 OUTPUT_DIR = Path("generated_websites")
 OUTPUT_DIR.mkdir(exist_ok=True)
 
-class BrandingRequest(BaseModel):
-    company_name: str = Field(..., description="Name of the company")
-    brand_identity: str = Field(..., description="Brand identity description")
-    tone: str = Field(..., description="Tone of voice: formal, semiformal, casual, or playful")
-    design_style: str = Field(..., description="Design style: modern, minimalistic, corporate, or artistic")
-    primary_color: str = Field(..., description="Primary color in HEX format (e.g., #FF5733)")
+
+def _build_generation_prompt(request: BrandingRequest) -> tuple[str, dict]:
+    """
+    Turn a request into its brand parameters and the prompt built from them.
+    Both generation endpoints go through here, so the same request produces
+    the same prompt, and therefore the same cache key, on either endpoint.
+    """
+    # Input is validated and normalized by BrandingRequest's field validators
+    brand_parameters = {
+        "company_name": request.company_name,
+        "brand_identity": request.brand_identity,
+        "tone": request.tone,
+        "design_style": request.design_style,
+        "primary_color": request.primary_color
+    }
+    return create_prompt_from_parameters(brand_parameters), brand_parameters
+
+
+async def _get_or_generate_html(request: BrandingRequest) -> tuple[str, dict]:
+    """
+    Return the HTML for a request along with its brand parameters. Repeats
+    (including of a preview) are served from query_chatgpt's caches, which
+    check the in-process cache before the persistent S3 one.
+    """
+    prompt, brand_parameters = _build_generation_prompt(request)
     
-    # Validate tone
-    @classmethod
-    def validate_tone(cls, v):
-        valid_tones = ["formal", "semiformal", "casual", "playful"]
-        if v.lower() not in valid_tones:
-            raise ValueError(f"Tone must be one of: {', '.join(valid_tones)}")
-        return v.lower()
+    # Query ChatGPT with the prompt
+    html_content = await query_chatgpt_function(prompt, verbose=True, brand_parameters=brand_parameters)
     
-    # Validate design_style
-    @classmethod
-    def validate_design_style(cls, v):
-        valid_styles = ["modern", "minimalistic", "corporate", "artistic"]
-        if v.lower() not in valid_styles:
-            raise ValueError(f"Design style must be one of: {', '.join(valid_styles)}")
-        return v.lower()
+    # Validate the HTML; only pages that pass are cached
+    if not validate_html(html_content):
+        logger.warning("HTML validation failed, but continuing...")
     
-    # Validate HEX color
-    @classmethod
-    def validate_hex_color(cls, v):
-        hex_pattern = r'^#(?:[0-9a-fA-F]{3}){1,2}$'
-        if not re.match(hex_pattern, v):
-            raise ValueError("Primary color must be a valid HEX color (e.g., #FF5733 or #F57)")
-        return v.upper()
+    return html_content, brand_parameters
 
 @app.post("/generate-brand-content")
 async def generate_brand_content(request: BrandingRequest):
@@ -51,81 +72,48 @@ async def generate_brand_content(request: BrandingRequest):
     Saves the HTML file and returns the file path.
     """
     
-    # Validate and normalize input
     try:
-        tone = request.validate_tone(request.tone)
-        design_style = request.validate_design_style(request.design_style)
-        primary_color = request.validate_hex_color(request.primary_color)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    
-    # Store the parameters
-    brand_parameters = {
-        "company_name": request.company_name,
-        "brand_identity": request.brand_identity,
-        "tone": tone,
-        "design_style": design_style,
-        "primary_color": primary_color
-    }
-    
-    try:
-        # Create the enhanced prompt using the brand parameters
-        prompt = create_prompt_from_parameters(brand_parameters)
-        
-        # Query ChatGPT with the prompt
-        html_content = query_chatgpt_function(prompt, verbose=True)
-        
-        # Validate the HTML
-        if not validate_html(html_content):
-            print("Warning: HTML validation failed, but continuing...")
+        html_content, brand_parameters = await _get_or_generate_html(request)
         
         # Generate filename with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_company_name = re.sub(r'[^\w\s-]', '', request.company_name).strip().replace(' ', '_').lower()
+        safe_company_name = sanitize_company_name(request.company_name)
         filename = f"{safe_company_name}_{timestamp}.html"
         filepath = OUTPUT_DIR / filename
         
-        # Save HTML to file locally
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        
-        print(f"✅ HTML saved locally to: {filepath}")
+        s3_metadata = {
+            "brand_identity": brand_parameters["brand_identity"],
+            "tone": brand_parameters["tone"],
+            "design_style": brand_parameters["design_style"],
+            "primary_color": brand_parameters["primary_color"]
+        }
         
-        # Upload to S3 and get public URL
-        try:
-            s3_metadata = {
-                "brand_identity": brand_parameters["brand_identity"],
-                "tone": brand_parameters["tone"],
-                "design_style": brand_parameters["design_style"],
-                "primary_color": brand_parameters["primary_color"]
-            }
-            
-            s3_result = upload_html_to_s3(
+        # Save HTML locally and upload to S3 concurrently, each in a worker
+        # thread so the event loop stays free. This also happens when the page
+        # came from cache: every call returns its own timestamped local file,
+        # brand-websites/ object and fresh 7-day URL, which is the endpoint's
+        # contract (a previous URL may already have expired), so only the
+        # generation is skipped on a hit, not the publication.
+        local_result, s3_result = await asyncio.gather(
+            asyncio.to_thread(filepath.write_text, html_content, encoding='utf-8'),
+            asyncio.to_thread(
+                upload_html_to_s3,
                 html_content=html_content,
                 company_name=request.company_name,
-                metadata=s3_metadata
-            )
-            
-            return {
-                "success": True,
-                "message": "Website generated and uploaded to S3 successfully",
-                "local_file": {
-                    "filename": filename,
-                    "filepath": str(filepath)
-                },
-                "s3": {
-                    "public_url": s3_result["public_url"],
-                    "s3_key": s3_result["s3_key"],
-                    "bucket": s3_result["bucket"],
-                    "region": s3_result["region"]
-                },
-                "company_name": request.company_name,
-                "timestamp": timestamp
-            }
-            
-        except Exception as s3_error:
+                metadata=s3_metadata,
+                timestamp=timestamp
+            ),
+            return_exceptions=True
+        )
+        
+        if isinstance(local_result, Exception):
+            raise local_result
+        
+        logger.info("✅ HTML saved locally to: %s", filepath)
+        
+        if isinstance(s3_result, Exception):
             # If S3 upload fails, still return success with local file info
-            print(f"⚠️ S3 upload failed: {str(s3_error)}")
+            logger.warning("⚠️ S3 upload failed: %s", s3_result)
             return {
                 "success": True,
                 "message": "Website generated locally, but S3 upload failed",
@@ -133,11 +121,28 @@ async def generate_brand_content(request: BrandingRequest):
                     "filename": filename,
                     "filepath": str(filepath)
                 },
-                "s3_error": str(s3_error),
+                "s3_error": str(s3_result),
                 "company_name": request.company_name,
                 "timestamp": timestamp
             }
         
+        return {
+            "success": True,
+            "message": "Website generated and uploaded to S3 successfully",
+            "local_file": {
+                "filename": filename,
+                "filepath": str(filepath)
+            },
+            "s3": {
+                "public_url": s3_result["public_url"],
+                "s3_key": s3_result["s3_key"],
+                "bucket": s3_result["bucket"],
+                "region": s3_result["region"]
+            },
+            "company_name": request.company_name,
+            "timestamp": timestamp
+        }
+        
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating content: {str(e)}")
 
@@ -161,35 +166,28 @@ async def download_file(filename: str):
 async def generate_brand_content_preview(request: BrandingRequest):
     """
     Endpoint to generate and preview the brand website directly (for testing).
-    Returns the HTML directly so you can view it in a browser.
+    Streams the HTML as it is generated so you can view it in a browser.
     """
     
-    # Validate and normalize input
-    try:
-        tone = request.validate_tone(request.tone)
-        design_style = request.validate_design_style(request.design_style)
-        primary_color = request.validate_hex_color(request.primary_color)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    
-    # Store the parameters
-    brand_parameters = {
-        "company_name": request.company_name,
-        "brand_identity": request.brand_identity,
-        "tone": tone,
-        "design_style": design_style,
-        "primary_color": primary_color
-    }
-    
     try:
-        # Create the enhanced prompt using the brand parameters
-        prompt = create_prompt_from_parameters(brand_parameters)
+        prompt, brand_parameters = _build_generation_prompt(request)
+        
+        # Stream the HTML to the browser as ChatGPT generates it; a cached
+        # page is sent in one chunk. The first chunk is awaited here, before
+        # any headers are sent, so lookup, auth and connection errors still
+        # become a 500 instead of an empty 200.
+        chunks = stream_chatgpt(prompt, brand_parameters=brand_parameters)
+        try:
+            first_chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            first_chunk = ""
         
-        # Query ChatGPT with the prompt
-        html_content = query_chatgpt_function(prompt, verbose=True)
+        async def _body():
+            yield first_chunk
+            async for chunk in chunks:
+                yield chunk
         
-        # Return the HTML directly for preview
-        return HTMLResponse(content=html_content)
+        return StreamingResponse(_body(), media_type="text/html")
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating content: {str(e)}")
@@ -208,6 +206,13 @@ async def health_check():
     """
     return {"status": "healthy"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Response cache hit/miss statistics.
+    """
+    return get_cache_stats()
+
 @app.get("/s3/config")
 async def check_s3_config():
     """
@@ -223,16 +228,35 @@ async def check_s3_config():
         raise HTTPException(status_code=500, detail=f"Error checking S3 config: {str(e)}")
 
 @app.get("/s3/files")
-async def list_s3_files(max_items: int = 100):
+async def list_s3_files(max_items: int = 100, include_urls: bool = False):
     """
-    List uploaded files in S3.
+    List uploaded files in S3. Pre-signed URLs are only generated when
+    include_urls is set; otherwise use /s3/files/url for a single file.
     """
     try:
-        files = list_uploaded_files(max_items=max_items)
+        files = list_uploaded_files(max_items=max_items, include_urls=include_urls)
         return {
             "success": True,
             "count": len(files),
             "files": files
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error listing S3 files: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error listing S3 files: {str(e)}")
+
+@app.get("/s3/files/url")
+async def get_s3_file_url(key: str):
+    """
+    Generate a pre-signed URL (valid for 7 days) for one uploaded file.
+    Only keys under the uploaded websites prefix can be signed.
+    """
+    if not key.startswith(UPLOAD_PREFIX):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    try:
+        return {
+            "key": key,
+            "url": presign_url(key),
+            "url_expires_in": "7 days"
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating S3 URL: {str(e)}")
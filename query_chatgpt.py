@@ -1,14 +1,182 @@
 import os 
 import re
-from dotenv import load_dotenv
-from openai import OpenAI
+import asyncio
+import time
+import hashlib
+import httpx
+import logging
+import contextlib
+from collections import OrderedDict
+from types import MappingProxyType
+from functools import lru_cache
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+import llm_cache
+import semantic_cache
+import serialization
+from config import get_config
+from rate_limiter import RateLimitedDispatcher
 
-# load environment variables from a .env file
-load_dotenv()
-openai_api_key = os.getenv("OPENAI_API_KEY")
+logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=openai_api_key)
+# Initialize OpenAI client (async so requests don't block the event loop) on
+# first use, so importing this module reads no config and opens no pool.
+# Shared by all requests over one pooled HTTP/2 connection set sized for
+# batch concurrency, so TLS handshakes are not repeated per call; timeouts
+# keep a slow API from piling up hung requests. The SDK's own retries are off:
+# generation calls are retried by the rate-limited dispatcher, which charges
+# every attempt against the request/token budget.
+@lru_cache(maxsize=1)
+def get_client() -> AsyncOpenAI:
+    http_client = DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+    )
+    return AsyncOpenAI(
+        api_key=get_config().openai_api_key,
+        http_client=http_client,
+        max_retries=0,
+        timeout=httpx.Timeout(120.0, connect=10.0)
+    )
+
+
+MODEL = "gpt-5-nano"
+# Default effort; "high" is only paid for when the output is unusable
+REASONING_EFFORT = "medium"
+ESCALATION_EFFORT = "high"
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# One canonical string with no stray whitespace: the system message opens
+# every request, so it must be byte-identical across calls and processes for
+# OpenAI prompt caching to match the prefix
+SYSTEM_PROMPT = (
+    "You are an elite web developer and CSS artist who creates visually stunning, "
+    "highly interactive websites. You excel at CSS techniques, like creative layouts. "
+    "You always output pure HTML with embedded CSS, never using markdown code blocks or backticks. "
+    "Your websites are memorable, beautiful, and push the boundaries of what's possible "
+    "with CSS while maintaining perfect functionality. "
+    "You strictly follow user instructions and brand guidelines to create unique web experiences. "
+    "Your responses never include explanations or extra text—only the requested HTML code. "
+    "You ensure the HTML starts with <!DOCTYPE html> and ends with </html>. "
+    "Your response contains no escape characters or backslashes. "
+    "And you never reference images; all visuals are created using CSS only."
+)
+
+_SYSTEM_MSG = {"role": "system", "content": SYSTEM_PROMPT}
+
+# Rough output budget (reasoning + HTML) used when estimating a call's tokens
+ESTIMATED_OUTPUT_TOKENS = 8000
+
+
+@lru_cache(maxsize=1)
+def _get_dispatcher() -> RateLimitedDispatcher:
+    """
+    Shared request/token budget for generation calls, sized from the
+    OPENAI_MAX_* settings.
+    """
+    config = get_config()
+    return RateLimitedDispatcher(config.openai_max_requests_per_minute, config.openai_max_tokens_per_minute)
+
+
+# Markdown cleanup patterns compiled once at import. _CLEANUP_RE removes, in a
+# single pass, code fence markers, stray backticks and literal \n / \r sequences.
+_CLEANUP_RE = re.compile(r'^```(?:html)?[\r\n]*|[\r\n]*```$|`|\\n|\\r', re.MULTILINE)
+_MULTI_NL = re.compile(r'\n{3,}')
+# Per-chunk variant for streamed output, where fences are handled separately
+_STREAM_CLEANUP_RE = re.compile(r'`|\\n|\\r')
+
+# In-process cache of cleaned HTML responses, keyed by a hash of the request
+CACHE_MAX_ENTRIES = 512
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60  # 7 days
+
+_response_cache: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+_cache_stats = {"hits": 0, "persistent_hits": 0, "semantic_hits": 0, "misses": 0}
+# Input tokens reported by OpenAI, to check that prompt-prefix caching is hitting
+_prompt_token_stats = {"input_tokens": 0, "cached_tokens": 0}
+
+
+def _cache_key(model: str, system_prompt: str, user_prompt: str, effort: str) -> str:
+    """
+    Build a SHA-256 cache key from everything that determines the model output.
+    """
+    payload = serialization.dumps({
+        "model": model,
+        "effort": effort,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+    }, sort_keys=True)
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _cache_get(key: str):
+    """
+    Return the cached HTML for a key, or None if missing or expired.
+    """
+    entry = _response_cache.get(key)
+    if entry is None:
+        return None
+    stored_at, html_content = entry
+    if time.time() - stored_at > CACHE_TTL_SECONDS:
+        del _response_cache[key]
+        return None
+    _response_cache.move_to_end(key)
+    return html_content
+
+
+def _cache_put(key: str, html_content: str) -> None:
+    """
+    Store cleaned HTML for a key, evicting the least recently used entries.
+    """
+    _response_cache[key] = (time.time(), html_content)
+    _response_cache.move_to_end(key)
+    while len(_response_cache) > CACHE_MAX_ENTRIES:
+        _response_cache.popitem(last=False)
+
+
+def get_cache_stats() -> dict:
+    """
+    Return hit/miss counters and the current size of the response cache.
+    """
+    hits = _cache_stats["hits"] + _cache_stats["persistent_hits"] + _cache_stats["semantic_hits"]
+    total = hits + _cache_stats["misses"]
+    return {
+        "hits": _cache_stats["hits"],
+        "persistent_hits": _cache_stats["persistent_hits"],
+        "semantic_hits": _cache_stats["semantic_hits"],
+        "misses": _cache_stats["misses"],
+        "hit_rate": hits / total if total else 0.0,
+        "entries": len(_response_cache),
+        "semantic_entries": semantic_cache.size(),
+        "max_entries": CACHE_MAX_ENTRIES,
+        "openai_prompt_cache": dict(_prompt_token_stats)
+    }
+
+
+def _record_usage(usage) -> None:
+    """
+    Accumulate input and cached-input token counts from a response's usage.
+    """
+    if usage is None:
+        return
+    details = getattr(usage, "input_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    _prompt_token_stats["input_tokens"] += usage.input_tokens
+    _prompt_token_stats["cached_tokens"] += cached_tokens
+    logger.debug("OpenAI usage: %d input tokens, %d from prompt cache", usage.input_tokens, cached_tokens)
+
+
+async def _embed(text: str):
+    """
+    Embed brand text for the semantic cache. Returns None if the call fails so
+    generation can still go ahead without the semantic layer.
+    """
+    try:
+        response = await get_client().embeddings.create(model=EMBEDDING_MODEL, input=text)
+        return response.data[0].embedding
+    except Exception as e:
+        logger.warning("Embedding failed, skipping semantic cache: %s", e)
+        return None
 
 
 def clean_html_response(html_content: str) -> str:
@@ -16,135 +184,573 @@ def clean_html_response(html_content: str) -> str:
     Clean the HTML response from ChatGPT by removing markdown code blocks
     and excessive line breaks.
     """
-    # Remove markdown code block markers (```html, ```, etc.)
-    cleaned = re.sub(r'^```(?:html)?[\r\n]*', '', html_content, flags=re.MULTILINE)
-    cleaned = re.sub(r'[\r\n]*```$', '', cleaned, flags=re.MULTILINE)
+    # Remove markdown code block markers, remaining backticks and \n / \r characters
+    cleaned = _CLEANUP_RE.sub('', html_content)
     
-    # Remove excessive consecutive line breaks (keep max 2)
-    cleaned = re.sub(r'\n{3,}', '\n\n', cleaned)
-    
-    # Remove any remaining backticks
-    cleaned = cleaned.replace('`', '')
-    
-    # Trim whitespace from start and end
-    cleaned = cleaned.strip()
+    # Remove excessive consecutive line breaks (keep max 2) and trim whitespace.
+    # This runs after the removals above, so it also collapses newline runs
+    # that only became adjacent once backticks or literal \n / \r between
+    # them were removed (e.g. 'a\n\\n\n\nb' -> 'a\n\nb')
+    return _MULTI_NL.sub('\n\n', cleaned).strip()
 
-    # Remove \n and \r characters
-    cleaned = cleaned.replace('\\n', '').replace('\\r', '')
 
-    
-    return cleaned
+# Map tone to specific design characteristics. Both maps are read-only views:
+# they are baked into STATIC_PREFIX, so changing them at runtime would make
+# prompts disagree with the reference lists the model sees
+_TONE_MAP = MappingProxyType({
+    'formal': 'sophisticated, elegant, professional.',
+    'semiformal': 'balanced, modern, approachable.',
+    'casual': 'friendly, relaxed, inviting with playful.',
+    'playful': 'fun, energetic, creative.'
+})
+
+# Map design style to specific CSS features
+_STYLE_MAP = MappingProxyType({
+    'modern': 'gradients, glassmorphism, CSS Grid, flexbox, smooth shadows, parallax effects',
+    'minimalistic': 'clean lines, generous whitespace, subtle animations, focus on typography',
+    'corporate': 'structured layouts, professional color schemes, hover effects, card designs',
+    'artistic': 'creative layouts, bold typography, animated backgrounds, unique shapes, CSS art'
+})
+
+# Everything that is identical across requests goes first so OpenAI's
+# prefix-based prompt caching can reuse it; brand parameters go last.
+# OpenAI only caches prefixes of at least 1024 tokens, which the system prompt
+# plus this prefix do not reach yet; openai_prompt_cache in get_cache_stats()
+# shows whether any cached_tokens are being reported.
+STATIC_PREFIX = """
+Create a stunning, modern, and highly interactive single-page website for the company described in BRAND PARAMETERS below.
+
+MINIMAL REQUIREMENTS:
+1. The website must include a header, features/services section, about us, and footer. 
+2. Use the Primary Color from BRAND PARAMETERS as the primary accent color throughout the design.
+3. Ensure the website is fully responsive with media queries only using the top 3 common screens width and looks great on all devices (mobile, tablet, desktop).
+4. Implement smooth scrolling and interactive hover effects.
+
+STRICT REQUIREMENTS:
+1. Return ONLY pure HTML code with embedded CSS. No explanations, no markdown, no comments.
+2. Start directly with <!DOCTYPE html> and end with </html>
+3. Do not add escape characters or backslashes.
+4. Return only the HTML and CSS content. 
+5. No images. All visuals must be created using CSS only.
+6. The whole website must fit within a single HTML file with embedded CSS.
+
+TONE REFERENCE:
+""" + "\n".join(f"- {name}: {description}" for name, description in _TONE_MAP.items()) + """
+
+DESIGN STYLE REFERENCE:
+""" + "\n".join(f"- {name}: {features}" for name, features in _STYLE_MAP.items()) + "\n"
+
+DYNAMIC_SUFFIX = """
+BRAND PARAMETERS:
+- Company Name: {company_name} 
+- Brand Identity: {brand_identity}
+- Tone: {tone_description}
+- Design Style: {style_features}
+- Primary Color: {primary_color} (use this as the main accent color)
+
+Make this website visually stunning, memorable, and unique. Maintain usability and brand consistency. The website should feel {tone_description} and showcase {style_features}.
+
+IMPORTANT: Output ONLY the HTML code starting with <!DOCTYPE html>. No markdown, no backticks, no explanations, no break.
+"""
+
+# Full prompt as one constant format string, filled in with format_map
+_PROMPT_TEMPLATE = STATIC_PREFIX + DYNAMIC_SUFFIX
+
+
+@lru_cache(maxsize=1024)
+def _build_prompt(company_name: str, brand_identity: str, tone: str, design_style: str, primary_color: str) -> str:
+    """
+    Build the prompt for one combination of brand parameters. Memoized, since
+    UI iterations and retries resend the same parameters.
+    """
+    return _PROMPT_TEMPLATE.format_map({
+        "company_name": company_name,
+        "brand_identity": brand_identity,
+        "tone_description": _TONE_MAP.get(tone, tone),
+        "style_features": _STYLE_MAP.get(design_style, design_style),
+        "primary_color": primary_color
+    })
 
 
 def create_prompt_from_parameters(params: dict) -> str:
     """
     Create an enhanced prompt string from the brand parameters for more creative websites.
     params: Dictionary containing brand parameters.
-    Returns a formatted prompt string.
-    """
-    # Map tone to specific design characteristics
-    tone_mappings = {
-        'formal': 'sophisticated, elegant, professional.',
-        'semiformal': 'balanced, modern, approachable.',
-        'casual': 'friendly, relaxed, inviting with playful.',
-        'playful': 'fun, energetic, creative.'
-    }
-    
-    # Map design style to specific CSS features
-    style_mappings = {
-        'modern': 'gradients, glassmorphism, CSS Grid, flexbox, smooth shadows, parallax effects',
-        'minimalistic': 'clean lines, generous whitespace, subtle animations, focus on typography',
-        'corporate': 'structured layouts, professional color schemes, hover effects, card designs',
-        'artistic': 'creative layouts, bold typography, animated backgrounds, unique shapes, CSS art'
-    }
-    
-    tone_description = tone_mappings.get(params['tone'], params['tone'])
-    style_features = style_mappings.get(params['design_style'], params['design_style'])
-    
-    prompt = f"""
-    Create a stunning, modern, and highly interactive single-page website for {params['company_name']}.
-    
-    MINIMAL REQUIREMENTS:
-    1. The website must include a header, features/services section, about us, and footer. 
-    2. Use {params['primary_color']} as the primary accent color throughout the design.
-    3. Ensure the website is fully responsive with media queries only using the top 3 common screens width and looks great on all devices (mobile, tablet, desktop).
-    4. Implement smooth scrolling and interactive hover effects.
-
-    STRICT REQUIREMENTS:
-    1. Return ONLY pure HTML code with embedded CSS. No explanations, no markdown, no comments.
-    2. Start directly with <!DOCTYPE html> and end with </html>
-    3. Do not add escape characters or backslashes.
-    4. Return only the HTML and CSS content. 
-    5. No images. All visuals must be created using CSS only.
-    6. The whole website must fit within a single HTML file with embedded CSS.
-    
-    BRAND PARAMETERS:
-    - Company Name: {params['company_name']} 
-    - Brand Identity: {params['brand_identity']}
-    - Tone: {tone_description}
-    - Design Style: {style_features}
-    - Primary Color: {params['primary_color']} (use this as the main accent color)
-
-    Make this website visually stunning, memorable, and unique. Maintain usability and brand consistency. The website should feel {tone_description} and showcase {style_features}.
-    
-    IMPORTANT: Output ONLY the HTML code starting with <!DOCTYPE html>. No markdown, no backticks, no explanations, no break.
+    Returns a formatted prompt string: the static instructions followed by the brand parameters.
+    """
+    logger.debug("Enhanced prompt created for %s", params['company_name'])
+    return _build_prompt(params['company_name'], params['brand_identity'], params['tone'],
+                         params['design_style'], params['primary_color'])
+
+
+# Identifies the model and prompt wording in semantic cache partitions, so
+# entries generated for an older prompt or model are never matched
+_PROMPT_VERSION = hashlib.sha256((MODEL + SYSTEM_PROMPT + _PROMPT_TEMPLATE).encode('utf-8')).hexdigest()
+
+
+def _semantic_query(brand_parameters: dict) -> tuple[str, str]:
     """
+    Split brand parameters into the semantic cache's exact-match partition
+    (prompt version, tone, design style, primary color) and the text that is
+    compared by similarity (company name and brand identity). Two requests
+    that differ only in color or tone must never share a page.
+    """
+    partition = hashlib.sha256(serialization.dumps([
+        _PROMPT_VERSION,
+        brand_parameters['tone'],
+        brand_parameters['design_style'],
+        brand_parameters['primary_color']
+    ])).hexdigest()
+    text = f"{brand_parameters['company_name']}\n{brand_parameters['brand_identity']}"
+    return partition, text
+
+
+async def _lookup_cached(key: str, brand_parameters: dict = None):
+    """
+    Look a prompt up in the in-process exact-match cache (L1), then the
+    persistent S3 cache, then, if the brand parameters the prompt was built
+    from are given, the semantic cache (L2). Returns (cached_html, semantic);
+    cached_html is None on a miss, and semantic is the (partition, embedding)
+    the caller can store the fresh response under, or None.
+    """
+    cached_html = _cache_get(key)
+    if cached_html is not None:
+        _cache_stats["hits"] += 1
+        return cached_html, None
 
-    print(f"Enhanced prompt created for {params['company_name']}")
+    cached_html = await asyncio.to_thread(llm_cache.get, key)
+    if cached_html is not None:
+        _cache_stats["persistent_hits"] += 1
+        _cache_put(key, cached_html)
+        return cached_html, None
 
-    return prompt
+    semantic = None
+    if brand_parameters is not None:
+        semantic_cache.start_loading()
+        partition, text = _semantic_query(brand_parameters)
+        embedding = await _embed(text)
+        if embedding is not None:
+            semantic = (partition, embedding)
+            similar_html = await asyncio.to_thread(semantic_cache.lookup, partition, embedding)
+            if similar_html is not None:
+                _cache_stats["semantic_hits"] += 1
+                # Backfill L1 so the next identical request skips the embedding
+                # call; a near match is never written to the persistent cache
+                _cache_put(key, similar_html)
+                return similar_html, semantic
 
+    _cache_stats["misses"] += 1
+    return None, semantic
 
-def query_chatgpt_function(prompt: str, verbose: bool = True) -> str:
+
+# S3 cache writes still in flight; referenced here so they are not garbage
+# collected before they finish
+_background_writes: set = set()
+
+
+def _persist(key: str, entry, cleaned_html: str) -> None:
+    """
+    Write a response to the persistent S3 caches. Blocking; runs in a worker
+    thread. Both writers log their failures instead of raising.
+    """
+    llm_cache.put(key, cleaned_html)
+    if entry is not None:
+        semantic_cache.persist(key, entry)
+
+
+def _store_response(key: str, semantic, cleaned_html: str) -> None:
+    """
+    Populate every cache layer with a freshly generated response. The
+    in-process layers are updated immediately; the S3 writes run as a
+    background task so the response is not held back by them. Pages that
+    fail validation (e.g. a truncated stream) are not cached, so the next
+    request regenerates them, escalating the effort if needed.
+    """
+    if not validate_html(cleaned_html):
+        logger.warning("Not caching HTML that failed validation")
+        return
+    _cache_put(key, cleaned_html)
+    entry = None
+    if semantic is not None:
+        partition, embedding = semantic
+        entry = semantic_cache.insert(partition, key, embedding, cleaned_html)
+    task = asyncio.create_task(asyncio.to_thread(_persist, key, entry, cleaned_html))
+    _background_writes.add(task)
+    task.add_done_callback(_background_writes.discard)
+
+
+class _StreamCleaner:
+    """
+    Incremental counterpart of clean_html_response for streamed output.
+    Drops the opening code fence, leading whitespace, backticks and literal
+    \\n / \\r sequences as chunks arrive.
+    """
+    def __init__(self):
+        self._pending = ""
+        self._fence_done = False
+        self._started = False
+
+    def feed(self, delta: str) -> str:
+        text = self._pending + delta
+        self._pending = ""
+
+        if not self._fence_done:
+            stripped = text.lstrip()
+            # Could still be (part of) an opening ```html fence, wait for more
+            if "```html".startswith(stripped):
+                self._pending = text
+                return ""
+            if stripped.startswith("```html"):
+                text = stripped[7:]
+            elif stripped.startswith("```"):
+                text = stripped[3:]
+            self._fence_done = True
+
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+
+        # A trailing backslash may be the first half of a literal \n or \r
+        if text.endswith("\\"):
+            self._pending = text[-1]
+            text = text[:-1]
+
+        return _STREAM_CLEANUP_RE.sub('', text)
+
+    def flush(self) -> str:
+        if not self._fence_done:
+            return ""
+        text, self._pending = self._pending, ""
+        return text
+
+
+def _open_stream(prompt: str, effort: str):
+    """
+    Start a streamed generation request (an async context manager of events).
+    """
+    return get_client().responses.stream(
+        model=MODEL,
+        reasoning={"effort": effort},
+        input=[
+            _SYSTEM_MSG,
+            {"role": "user", "content": prompt}
+        ]
+    )
+
+
+def _finish_streamed_html(cleaned: str) -> str:
+    """
+    Complete the cleanup of _StreamCleaner output. The closing fence's
+    backticks are already gone; only blank lines and edge whitespace remain.
+    """
+    return _MULTI_NL.sub('\n\n', cleaned).strip()
+
+
+async def _generate_html(prompt: str, effort: str) -> str:
+    """
+    Run one generation at the given reasoning effort and return the cleaned HTML.
+    The output is cleaned incrementally as it streams in, so the raw response
+    is never buffered next to a cleaned copy. The call is scheduled through
+    the shared rate limiter, and a retried call restarts the stream.
+    """
+    estimated_tokens = (len(SYSTEM_PROMPT) + len(prompt)) // 4 + ESTIMATED_OUTPUT_TOKENS
+
+    async def _call():
+        cleaner = _StreamCleaner()
+        chunks = []
+        async with _open_stream(prompt, effort) as stream:
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    chunks.append(cleaner.feed(event.delta))
+                elif event.type == "response.completed":
+                    _record_usage(event.response.usage)
+        chunks.append(cleaner.flush())
+        return "".join(chunks)
+
+    return _finish_streamed_html(await _get_dispatcher().run(_call, estimated_tokens))
+
+
+async def query_chatgpt_function(prompt: str, verbose: bool = True, effort: str = REASONING_EFFORT,
+                                 escalate: bool = True, brand_parameters: dict = None) -> str:
     """
     Function to query ChatGPT with enhanced parameters for better output.
+    Identical requests are served from the exact-match caches (in-process L1,
+    then S3). When brand_parameters (the parameters the prompt was built
+    from) are given, near duplicates with the same tone, style and color are
+    served from the semantic cache (L2). If the HTML generated at the
+    requested effort fails validation and escalate is set, it is regenerated
+    once at "high" effort. Pass effort="high" to opt into it up front.
     """
+    key = _cache_key(MODEL, SYSTEM_PROMPT, prompt, effort)
+    cached_html, semantic = await _lookup_cached(key, brand_parameters)
+    if cached_html is not None:
+        return cached_html
+
     try:
-        response = client.responses.create(
-            model="gpt-5-nano",
-            reasoning={"effort": "medium"},  # Use high effort for best quality output
-            input=[
-                {
-                    "role": "system", 
-                    "content": """You are an elite web developer and CSS artist who creates visually stunning, 
-                    highly interactive websites. You excel at CSS techniques, like creative layouts. You always output pure HTML with embedded CSS, 
-                    never using markdown code blocks or backticks. Your websites are memorable, beautiful, and 
-                    push the boundaries of what's possible with CSS while maintaining perfect functionality.
-                    You strictly follow user instructions and brand guidelines to create unique web experiences.
-                    Your responses never include explanations or extra text—only the requested HTML code. 
-                    You ensure the HTML starts with <!DOCTYPE html> and ends with </html>.
-                    Your response contains no escape characters or backslashes. And you never reference images; all visuals are created using CSS only."""
-                },
-                {"role": "user", "content": prompt}
-            ]
-        )
-        
-        # Get the response content using the correct attribute
-        html_content = response.output_text
-        
-        # Clean the response
-        cleaned_html = clean_html_response(html_content)
+        cleaned_html = await _generate_html(prompt, effort)
+
+        if escalate and effort != ESCALATION_EFFORT and not validate_html(cleaned_html):
+            logger.info("Output at effort=%s failed validation, retrying at effort=%s",
+                        effort, ESCALATION_EFFORT)
+            cleaned_html = await _generate_html(prompt, ESCALATION_EFFORT)
+
+        _store_response(key, semantic, cleaned_html)
         
         return cleaned_html
         
     except Exception as e:
-        print(f"Error querying ChatGPT: {str(e)}")
+        logger.error("Error querying ChatGPT: %s", e)
         raise
 
 
+# Maximum number of generations in flight at once for batch calls
+BATCH_CONCURRENCY = 10
+
+
+async def query_chatgpt_batch(prompts: list, concurrency: int = BATCH_CONCURRENCY, effort: str = REASONING_EFFORT,
+                              brand_parameters_list: list = None) -> list:
+    """
+    Generate HTML for many prompts concurrently over the shared client, with
+    at most `concurrency` requests in flight. brand_parameters_list, if given,
+    holds each prompt's brand parameters (see query_chatgpt_function). Results
+    are returned in the same order as the prompts.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    if brand_parameters_list is None:
+        brand_parameters_list = [None] * len(prompts)
+
+    async def _bounded(prompt: str, brand_parameters) -> str:
+        async with semaphore:
+            return await query_chatgpt_function(prompt, effort=effort, brand_parameters=brand_parameters)
+
+    return await asyncio.gather(*(
+        _bounded(prompt, brand_parameters) for prompt, brand_parameters in zip(prompts, brand_parameters_list)
+    ))
+
+
+# Brands generated per multi-brand request; keeps one response well inside
+# the model's output limit
+BRANDS_PER_REQUEST = 5
+# Read timeout per brand for a multi-brand request: it is not streamed, so no
+# bytes arrive until every site is done
+MULTI_BRAND_TIMEOUT_PER_BRAND = 120.0
+
+_MULTI_BRAND_INSTRUCTIONS = """
+MULTIPLE BRANDS:
+Create one complete website for EACH brand below, following every requirement above for each one independently.
+Return a JSON object whose "sites" array holds one item per brand, with "brand_id" set to the brand's id and "html" set to the full HTML document starting with <!DOCTYPE html> and ending with </html>.
+"""
+
+_MULTI_BRAND_BLOCK = """
+<brand id="{brand_id}">
+- Company Name: {company_name}
+- Brand Identity: {brand_identity}
+- Tone: {tone_description}
+- Design Style: {style_features}
+- Primary Color: {primary_color} (use this as the main accent color)
+</brand>
+"""
+
+_MULTI_BRAND_FORMAT = {
+    "type": "json_schema",
+    "name": "brand_sites",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "sites": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "brand_id": {"type": "string"},
+                        "html": {"type": "string"}
+                    },
+                    "required": ["brand_id", "html"],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "required": ["sites"],
+        "additionalProperties": False
+    }
+}
+
+
+async def _generate_multi_brand(params_list: list, effort: str) -> dict:
+    """
+    Generate sites for several brands in one request that shares the system
+    prompt and static instructions. Returns {index: cleaned_html} for the
+    brands the model returned; a failed, incomplete or unparsable response
+    yields {}.
+    """
+    prompt = STATIC_PREFIX + _MULTI_BRAND_INSTRUCTIONS + "".join(
+        _MULTI_BRAND_BLOCK.format(
+            brand_id=i,
+            company_name=params['company_name'],
+            brand_identity=params['brand_identity'],
+            tone_description=_TONE_MAP.get(params['tone'], params['tone']),
+            style_features=_STYLE_MAP.get(params['design_style'], params['design_style']),
+            primary_color=params['primary_color']
+        )
+        for i, params in enumerate(params_list)
+    )
+    estimated_tokens = (len(SYSTEM_PROMPT) + len(prompt)) // 4 + ESTIMATED_OUTPUT_TOKENS * len(params_list)
+    try:
+        response = await _get_dispatcher().run(
+            lambda: get_client().responses.create(
+                model=MODEL,
+                reasoning={"effort": effort},
+                input=[
+                    _SYSTEM_MSG,
+                    {"role": "user", "content": prompt}
+                ],
+                text={"format": _MULTI_BRAND_FORMAT},
+                timeout=httpx.Timeout(MULTI_BRAND_TIMEOUT_PER_BRAND * len(params_list), connect=10.0)
+            ),
+            estimated_tokens,
+            # A group that times out would time out again; fall back right away
+            retry_timeouts=False
+        )
+    except Exception as e:
+        # Non-retryable error, timeout or retries exhausted; the per-brand
+        # calls may still succeed
+        logger.warning("Multi-brand request failed, falling back to per-brand calls: %s", e)
+        return {}
+    _record_usage(response.usage)
+
+    # Typically the output token limit was hit; the JSON is truncated
+    if response.status == "incomplete":
+        logger.warning("Multi-brand response incomplete (%s), falling back to per-brand calls",
+                       response.incomplete_details)
+        return {}
+
+    try:
+        sites = serialization.loads(response.output_text)["sites"]
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning("Could not parse multi-brand response, falling back to per-brand calls: %s", e)
+        return {}
+
+    results = {}
+    for site in sites:
+        try:
+            index = int(site["brand_id"])
+        except (ValueError, KeyError, TypeError):
+            continue
+        if 0 <= index < len(params_list):
+            results[index] = clean_html_response(site["html"])
+    return results
+
+
+async def query_chatgpt_brand_batch(params_list: list, effort: str = REASONING_EFFORT,
+                                    brands_per_request: int = BRANDS_PER_REQUEST) -> list:
+    """
+    Generate websites for many brands while spending one request (and one
+    copy of the shared prompt prefix) per group of brands instead of one per
+    brand. Already-cached brands are skipped; any brand missing from a group's
+    response, or whose HTML fails validation, is generated with its own call.
+    Results are returned in the same order as params_list.
+    """
+    prompts = [create_prompt_from_parameters(params) for params in params_list]
+    keys = [_cache_key(MODEL, SYSTEM_PROMPT, prompt, effort) for prompt in prompts]
+    results = [_cache_get(key) for key in keys]
+    pending = [i for i, html_content in enumerate(results) if html_content is None]
+    persisted = await asyncio.gather(*(asyncio.to_thread(llm_cache.get, keys[i]) for i in pending))
+    for index, html_content in zip(pending, persisted):
+        if html_content is not None:
+            results[index] = html_content
+            _cache_put(keys[index], html_content)
+    pending = [i for i, html_content in enumerate(results) if html_content is None]
+
+    groups = [pending[i:i + brands_per_request] for i in range(0, len(pending), brands_per_request)]
+    group_results = await asyncio.gather(
+        *(_generate_multi_brand([params_list[i] for i in group], effort) for group in groups)
+    )
+    for group, generated in zip(groups, group_results):
+        for position, html_content in generated.items():
+            if validate_html(html_content):
+                index = group[position]
+                results[index] = html_content
+                _store_response(keys[index], None, html_content)
+
+    missing = [i for i, html_content in enumerate(results) if html_content is None]
+    if missing:
+        fallback = await query_chatgpt_batch([prompts[i] for i in missing], effort=effort,
+                                             brand_parameters_list=[params_list[i] for i in missing])
+        for index, html_content in zip(missing, fallback):
+            results[index] = html_content
+
+    return results
+
+
+async def stream_chatgpt(prompt: str, effort: str = REASONING_EFFORT, brand_parameters: dict = None):
+    """
+    Stream the generated HTML as it is decoded, for endpoints that can send
+    the page progressively. Cached responses are yielded in one piece, and a
+    completed stream that passes validate_html populates the caches like
+    query_chatgpt_function (which also describes brand_parameters).
+    """
+    key = _cache_key(MODEL, SYSTEM_PROMPT, prompt, effort)
+    cached_html, semantic = await _lookup_cached(key, brand_parameters)
+    if cached_html is not None:
+        yield cached_html
+        return
+
+    estimated_tokens = (len(SYSTEM_PROMPT) + len(prompt)) // 4 + ESTIMATED_OUTPUT_TOKENS
+    cleaner = _StreamCleaner()
+    chunks = []
+    try:
+        async with contextlib.AsyncExitStack() as stack:
+            # Opening the stream is scheduled and retried through the shared
+            # rate limiter; once output has been sent it can no longer be retried
+            stream = await _get_dispatcher().run(
+                lambda: stack.enter_async_context(_open_stream(prompt, effort)),
+                estimated_tokens
+            )
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    cleaned = cleaner.feed(event.delta)
+                    if cleaned:
+                        chunks.append(cleaned)
+                        yield cleaned
+                elif event.type == "response.completed":
+                    _record_usage(event.response.usage)
+        tail = cleaner.flush()
+        if tail:
+            chunks.append(tail)
+            yield tail
+
+    except Exception as e:
+        logger.error("Error streaming from ChatGPT: %s", e)
+        raise
+
+    _store_response(key, semantic, _finish_streamed_html("".join(chunks)))
+
+
 def validate_html(html_content: str) -> bool:
     """
     Basic validation to ensure the HTML content is properly formatted.
     """
-    # Check if it starts with DOCTYPE and ends with </html>
-    has_doctype = html_content.strip().lower().startswith('<!doctype html>') or \
-                  html_content.strip().lower().startswith('<html')
-    has_closing = html_content.strip().lower().endswith('</html>')
+    # Check if it starts with DOCTYPE and ends with </html>, stripping and
+    # lowercasing only a small window at each end instead of copying the whole
+    # document; the full strip is only needed for long whitespace padding
+    head = html_content[:64].lstrip()
+    if len(head) < 15:
+        head = html_content.lstrip()
+    tail = html_content[-64:].rstrip()
+    if len(tail) < 7:
+        tail = html_content.rstrip()
+    head = head[:15].lower()
+    tail = tail[-7:].lower()
+    has_doctype = head.startswith('<!doctype html>') or head.startswith('<html')
+    has_closing = tail == '</html>'
     
     if not has_doctype:
-        print("Warning: HTML doesn't start with DOCTYPE")
+        logger.warning("HTML doesn't start with DOCTYPE")
     if not has_closing:
-        print("Warning: HTML doesn't end with </html>")
+        logger.warning("HTML doesn't end with </html>")
     
     return has_doctype and has_closing
 
@@ -167,7 +773,7 @@ if __name__ == "__main__":
     prompt = create_prompt_from_parameters(test_params)
     
     # Query ChatGPT
-    html_result = query_chatgpt_function(prompt)
+    html_result = asyncio.run(query_chatgpt_function(prompt, brand_parameters=test_params))
     
     # Validate result
     if validate_html(html_result):
@@ -0,0 +1,89 @@
+import time
+import random
+import asyncio
+import logging
+from openai import RateLimitError, APIStatusError, APIConnectionError, APITimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """
+    Rate limits, server errors and connection problems are worth retrying;
+    anything else (bad request, auth) will fail the same way again.
+    """
+    if isinstance(error, (RateLimitError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+class RateLimitedDispatcher:
+    """
+    Token-bucket scheduler for OpenAI calls, after the OpenAI cookbook's
+    api_request_parallel_processor. Request and token capacity refill
+    continuously at the per-minute limits; a call waits until both buckets can
+    cover it, and retryable failures are re-run with exponential backoff.
+    """
+    def __init__(self, max_requests_per_minute: float, max_tokens_per_minute: float,
+                 max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_requests_per_minute = max_requests_per_minute
+        self.max_tokens_per_minute = max_tokens_per_minute
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.available_request_capacity = float(max_requests_per_minute)
+        self.available_token_capacity = float(max_tokens_per_minute)
+        self._last_update = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_update
+        self._last_update = now
+        self.available_request_capacity = min(
+            self.available_request_capacity + elapsed * self.max_requests_per_minute / 60.0,
+            self.max_requests_per_minute
+        )
+        self.available_token_capacity = min(
+            self.available_token_capacity + elapsed * self.max_tokens_per_minute / 60.0,
+            self.max_tokens_per_minute
+        )
+
+    async def _acquire(self, estimated_tokens: int) -> None:
+        # A single call larger than the whole bucket could never be scheduled
+        tokens = min(estimated_tokens, self.max_tokens_per_minute)
+        while True:
+            async with self._lock:
+                self._refill()
+                if self.available_request_capacity >= 1 and self.available_token_capacity >= tokens:
+                    self.available_request_capacity -= 1
+                    self.available_token_capacity -= tokens
+                    return
+                # Sleep roughly until the scarcer bucket has refilled enough
+                wait = max(
+                    (1 - self.available_request_capacity) * 60.0 / self.max_requests_per_minute,
+                    (tokens - self.available_token_capacity) * 60.0 / self.max_tokens_per_minute,
+                    0.01
+                )
+            await asyncio.sleep(wait)
+
+    async def run(self, call, estimated_tokens: int, retry_timeouts: bool = True):
+        """
+        Await call() once capacity is available, retrying retryable errors.
+        call: zero-argument function returning a new awaitable on each attempt.
+        retry_timeouts: set to False for calls whose timeout is already sized
+        to their expected duration, where a timeout would just repeat.
+        """
+        for attempt in range(self.max_attempts):
+            await self._acquire(estimated_tokens)
+            try:
+                return await call()
+            except Exception as e:
+                if (not _is_retryable(e) or attempt == self.max_attempts - 1
+                        or (not retry_timeouts and isinstance(e, APITimeoutError))):
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt + random.random())
+                logger.warning("OpenAI call failed (%s), retrying in %.1fs (attempt %d/%d)",
+                               e, delay, attempt + 1, self.max_attempts)
+                await asyncio.sleep(delay)
@@ -1,38 +1,103 @@
-import os
+import io
+import gzip
+import logging
+import threading
 import boto3
+import boto3.session
+from boto3.s3.transfer import TransferConfig
+from botocore.compat import HAS_CRT
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError
-from dotenv import load_dotenv
 from datetime import datetime
-import re
+from concurrent.futures import ThreadPoolExecutor
+from config import get_config
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# AWS Configuration
-AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
-AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
-S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
+# Generated websites live under this prefix; it is the only part of the
+# bucket that is listed or pre-signed for API callers (cache/ is internal)
+UPLOAD_PREFIX = "brand-websites/"
+
+# Upper bound on parallel uploads in upload_html_batch (within the client's pool)
+MAX_UPLOAD_WORKERS = 16
+
+# Pages stay single-part; anything over the threshold (after gzip) is sent
+# as parallel multipart chunks
+UPLOAD_TRANSFER_CONFIG = TransferConfig(multipart_threshold=4 * 1024 * 1024, max_concurrency=10)
+# CRC32C needs the awscrt extension (botocore[crt]); plain CRC32 is built in.
+# Either is much cheaper than the MD5 put_object would compute.
+UPLOAD_CHECKSUM_ALGORITHM = 'CRC32C' if HAS_CRT else 'CRC32'
+
+
+class _SafeCharTable(dict):
+    """
+    str.translate table for key-safe company names, with allow-list
+    semantics: letters and digits (any script), '-' and '_' are kept,
+    whitespace becomes '_', and everything else (punctuation, control
+    characters, symbols, emoji) is dropped. ASCII is precomputed; any other
+    code point is classified on first use and cached, so translate stays a
+    single C-level pass.
+    """
+    def __missing__(self, code_point: int):
+        char = chr(code_point)
+        if char.isspace():
+            value = '_'
+        elif char.isalnum() or char in '-_':
+            value = char
+        else:
+            value = None
+        self[code_point] = value
+        return value
+
+
+_SAFE_TRANS = _SafeCharTable()
+for _code_point in range(128):
+    _SAFE_TRANS[_code_point]
+del _code_point
+
+
+def sanitize_company_name(company_name: str) -> str:
+    """
+    Turn a company name into a lowercase, file- and S3-key-safe slug.
+    """
+    return company_name.translate(_SAFE_TRANS).strip('_').lower()
+
+
+# The shared client is first requested from worker threads (to_thread calls,
+# upload pools, the semantic cache loader), so creation is locked and uses a
+# dedicated session: boto3's default session is not thread-safe
+_s3_client = None
+_s3_client_lock = threading.Lock()
 
 
 def get_s3_client():
     """
     Create and return an S3 client with credentials from environment variables.
+    The client is created once and shared, so its connection pool (and the
+    TLS sessions in it) is reused across uploads. Safe to call from any thread.
     """
-    try:
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            region_name=AWS_REGION
-        )
-        return s3_client
-    except Exception as e:
-        print(f"Error creating S3 client: {str(e)}")
-        raise
+    global _s3_client
+    if _s3_client is not None:
+        return _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            config = get_config()
+            try:
+                _s3_client = boto3.session.Session().client(
+                    's3',
+                    aws_access_key_id=config.aws_access_key_id,
+                    aws_secret_access_key=config.aws_secret_access_key,
+                    region_name=config.aws_region,
+                    config=Config(max_pool_connections=50)
+                )
+            except Exception as e:
+                logger.error("Error creating S3 client: %s", e)
+                raise
+    return _s3_client
 
 
-def upload_html_to_s3(html_content: str, company_name: str, metadata: dict = None, url_expiration_days: int = 7) -> dict:
+def upload_html_to_s3(html_content: str, company_name: str, metadata: dict = None, url_expiration_days: int = 7,
+                      timestamp: str = None, key_suffix: str = "") -> dict:
     """
     Upload HTML content to S3 and return a pre-signed URL.
     
@@ -41,22 +106,26 @@ def upload_html_to_s3(html_content: str, company_name: str, metadata: dict = Non
         company_name: Name of the company (used for filename)
         metadata: Optional dictionary with additional metadata
         url_expiration_days: Number of days before the URL expires (default: 7)
+        timestamp: Optional "%Y%m%d_%H%M%S" timestamp for the filename (default: now)
+        key_suffix: Optional string appended to the filename, to keep keys unique
     
     Returns:
         Dictionary containing the S3 key, pre-signed URL, and bucket info
     """
+    config = get_config()
     try:
         # Validate that bucket name is set
-        if not S3_BUCKET_NAME:
+        if not config.s3_bucket_name:
             raise ValueError("S3_BUCKET_NAME not set in environment variables")
         
         # Create S3 client
         s3_client = get_s3_client()
         
         # Generate filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_company_name = re.sub(r'[^\w\s-]', '', company_name).strip().replace(' ', '_').lower()
-        s3_key = f"brand-websites/{safe_company_name}_{timestamp}.html"
+        if timestamp is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        safe_company_name = sanitize_company_name(company_name)
+        s3_key = f"{UPLOAD_PREFIX}{safe_company_name}_{timestamp}{key_suffix}.html"
         
         # Prepare metadata for S3
         s3_metadata = {
@@ -72,38 +141,37 @@ def upload_html_to_s3(html_content: str, company_name: str, metadata: dict = Non
                 safe_key = key.lower().replace('_', '-')
                 s3_metadata[safe_key] = str(value)
         
-        # Upload to S3 without ACL (bucket policy handles public access)
-        s3_client.put_object(
-            Bucket=S3_BUCKET_NAME,
-            Key=s3_key,
-            Body=html_content.encode('utf-8'),
-            ContentType='text/html',
-            Metadata=s3_metadata
-            # ACL removed - use bucket policy instead for public access
+        # Upload to S3 without ACL (bucket policy handles public access).
+        # HTML is stored gzip-compressed; browsers decompress it transparently
+        # on the pre-signed GET thanks to the Content-Encoding header.
+        s3_client.upload_fileobj(
+            io.BytesIO(gzip.compress(html_content.encode('utf-8'), compresslevel=6)),
+            config.s3_bucket_name,
+            s3_key,
+            ExtraArgs={
+                'ContentType': 'text/html',
+                'ContentEncoding': 'gzip',
+                'Metadata': s3_metadata,
+                'ChecksumAlgorithm': UPLOAD_CHECKSUM_ALGORITHM
+                # ACL removed - use bucket policy instead for public access
+            },
+            Config=UPLOAD_TRANSFER_CONFIG
         )
         
         # Calculate expiration in seconds
         expiration_seconds = url_expiration_days * 24 * 60 * 60
         
         # Generate a pre-signed URL
-        public_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': S3_BUCKET_NAME,
-                'Key': s3_key,
-                'ResponseContentDisposition': 'inline'
-            },
-            ExpiresIn=expiration_seconds
-        )
+        public_url = presign_url(s3_key, expiration_seconds)
         
-        print(f"✅ Successfully uploaded to S3: {s3_key}")
-        print(f"🌐 Pre-signed URL (expires in {url_expiration_days} days): {public_url}")
+        logger.info("✅ Successfully uploaded to S3: %s", s3_key)
+        logger.debug("🌐 Pre-signed URL (expires in %s days): %s", url_expiration_days, public_url)
         
         return {
             "success": True,
             "s3_key": s3_key,
-            "bucket": S3_BUCKET_NAME,
-            "region": AWS_REGION,
+            "bucket": config.s3_bucket_name,
+            "region": config.aws_region,
             "public_url": public_url,
             "url_expires_in": "7 days",
             "timestamp": timestamp
@@ -111,20 +179,61 @@ def upload_html_to_s3(html_content: str, company_name: str, metadata: dict = Non
         
     except NoCredentialsError:
         error_msg = "AWS credentials not found. Please set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY"
-        print(f"❌ {error_msg}")
+        logger.error("❌ %s", error_msg)
         raise Exception(error_msg)
     
     except ClientError as e:
         error_code = e.response['Error']['Code']
         error_msg = e.response['Error']['Message']
-        print(f"❌ S3 ClientError ({error_code}): {error_msg}")
+        logger.error("❌ S3 ClientError (%s): %s", error_code, error_msg)
         raise Exception(f"S3 upload failed: {error_msg}")
     
     except Exception as e:
-        print(f"❌ Unexpected error uploading to S3: {str(e)}")
+        logger.error("❌ Unexpected error uploading to S3: %s", e)
         raise
 
 
+def upload_html_batch(items: list, url_expiration_days: int = 7) -> list:
+    """
+    Upload several HTML pages to S3 in parallel over the shared client.
+    
+    Args:
+        items: List of (html_content, company_name, metadata) tuples
+        url_expiration_days: Number of days before the URLs expire (default: 7)
+    
+    Returns:
+        List of results in the same order as items: the upload_html_to_s3
+        dictionary on success, or {"success": False, "error": ...} on failure
+    """
+    if not items:
+        return []
+    
+    # One logical upload time for the whole batch; repeated company names get
+    # a "_2", "_3", ... suffix so they do not overwrite each other's key
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    seen = {}
+    suffixes = []
+    for _, company_name, _ in items:
+        safe_company_name = sanitize_company_name(company_name)
+        seen[safe_company_name] = seen.get(safe_company_name, 0) + 1
+        suffixes.append(f"_{seen[safe_company_name]}" if seen[safe_company_name] > 1 else "")
+    
+    with ThreadPoolExecutor(max_workers=min(MAX_UPLOAD_WORKERS, len(items))) as executor:
+        futures = [
+            executor.submit(upload_html_to_s3, html_content, company_name, metadata, url_expiration_days,
+                            timestamp, suffix)
+            for (html_content, company_name, metadata), suffix in zip(items, suffixes)
+        ]
+    
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append({"success": False, "error": str(e)})
+    return results
+
+
 def check_s3_configuration() -> dict:
     """
     Check if S3 is properly configured and accessible.
@@ -132,83 +241,97 @@ def check_s3_configuration() -> dict:
     Returns:
         Dictionary with configuration status
     """
+    config = get_config()
     config_status = {
-        "aws_access_key_set": bool(AWS_ACCESS_KEY_ID),
-        "aws_secret_key_set": bool(AWS_SECRET_ACCESS_KEY),
-        "bucket_name_set": bool(S3_BUCKET_NAME),
-        "region": AWS_REGION,
+        "aws_access_key_set": bool(config.aws_access_key_id),
+        "aws_secret_key_set": bool(config.aws_secret_access_key),
+        "bucket_name_set": bool(config.s3_bucket_name),
+        "region": config.aws_region,
         "bucket_accessible": False
     }
     
-    if not all([AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, S3_BUCKET_NAME]):
+    if not all([config.aws_access_key_id, config.aws_secret_access_key, config.s3_bucket_name]):
         return config_status
     
     try:
         s3_client = get_s3_client()
         # Try to head the bucket to check if it's accessible
-        s3_client.head_bucket(Bucket=S3_BUCKET_NAME)
+        s3_client.head_bucket(Bucket=config.s3_bucket_name)
         config_status["bucket_accessible"] = True
     except ClientError as e:
         error_code = e.response['Error']['Code']
-        print(f"Bucket check failed with error: {error_code}")
+        logger.warning("Bucket check failed with error: %s", error_code)
         config_status["bucket_accessible"] = False
     except Exception as e:
-        print(f"Error checking S3 configuration: {str(e)}")
+        logger.error("Error checking S3 configuration: %s", e)
         config_status["bucket_accessible"] = False
     
     return config_status
 
 
-def list_uploaded_files(prefix: str = "brand-websites/", max_items: int = 100) -> list:
+def presign_url(s3_key: str, expiration_seconds: int = 604800) -> str:
+    """
+    Generate a pre-signed GET URL for an uploaded file (default: 7 days).
+    """
+    config = get_config()
+    return get_s3_client().generate_presigned_url(
+        'get_object',
+        Params={
+            'Bucket': config.s3_bucket_name,
+            'Key': s3_key,
+            'ResponseContentDisposition': 'inline'
+        },
+        ExpiresIn=expiration_seconds
+    )
+
+
+def list_uploaded_files(prefix: str = UPLOAD_PREFIX, max_items: int = 100, include_urls: bool = False) -> list:
     """
     List files uploaded to S3 under a specific prefix.
     
+    Pre-signing every object up front costs one signature per file, most of
+    which are never used, so URLs are only included on request; otherwise
+    call presign_url() for the file that is actually opened.
+    
     Args:
         prefix: The S3 prefix (folder path) to search
         max_items: Maximum number of items to return
+        include_urls: Also generate a pre-signed URL (7 days) for every file
     
     Returns:
         List of dictionaries containing file information
     """
+    config = get_config()
     try:
-        if not S3_BUCKET_NAME:
+        if not config.s3_bucket_name:
             raise ValueError("S3_BUCKET_NAME not set in environment variables")
         
         s3_client = get_s3_client()
         
-        response = s3_client.list_objects_v2(
-            Bucket=S3_BUCKET_NAME,
+        paginator = s3_client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(
+            Bucket=config.s3_bucket_name,
             Prefix=prefix,
-            MaxKeys=max_items
+            PaginationConfig={'MaxItems': max_items}
         )
         
         files = []
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                # Generate pre-signed URL for each file (expires in 7 days)
-                presigned_url = s3_client.generate_presigned_url(
-                    'get_object',
-                    Params={
-                        'Bucket': S3_BUCKET_NAME,
-                        'Key': obj['Key'],
-                        'ResponseContentDisposition': 'inline'
-                    },
-                    ExpiresIn=604800  # 7 days
-                )
-                
+        for page in pages:
+            for obj in page.get('Contents', []):
                 file_info = {
                     'key': obj['Key'],
                     'size': obj['Size'],
-                    'last_modified': obj['LastModified'].isoformat(),
-                    'url': presigned_url,
-                    'url_expires_in': '7 days'
+                    'last_modified': obj['LastModified'].isoformat()
                 }
+                if include_urls:
+                    file_info['url'] = presign_url(obj['Key'])
+                    file_info['url_expires_in'] = '7 days'
                 files.append(file_info)
         
         return files
         
     except Exception as e:
-        print(f"Error listing S3 files: {str(e)}")
+        logger.error("Error listing S3 files: %s", e)
         raise
 
 
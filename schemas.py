@@ -0,0 +1,42 @@
+from pydantic import BaseModel, Field, field_validator
+import string
+
+_VALID_TONES = frozenset({"formal", "semiformal", "casual", "playful"})
+_VALID_STYLES = frozenset({"modern", "minimalistic", "corporate", "artistic"})
+_HEX_DIGITS = frozenset(string.hexdigits)
+
+
+class BrandingRequest(BaseModel):
+    # Length bounds are enforced by pydantic-core before any prompt is built
+    company_name: str = Field(..., min_length=1, max_length=100, description="Name of the company")
+    brand_identity: str = Field(..., min_length=1, max_length=500, description="Brand identity description")
+    tone: str = Field(..., max_length=20, description="Tone of voice: formal, semiformal, casual, or playful")
+    design_style: str = Field(..., max_length=20, description="Design style: modern, minimalistic, corporate, or artistic")
+    primary_color: str = Field(..., max_length=7, description="Primary color in HEX format (e.g., #FF5733)")
+    
+    # Validate tone
+    @field_validator("tone", mode="after")
+    @classmethod
+    def validate_tone(cls, v):
+        v_lower = v.lower()
+        if v_lower not in _VALID_TONES:
+            raise ValueError("Tone must be one of: formal, semiformal, casual, playful")
+        return v_lower
+    
+    # Validate design_style
+    @field_validator("design_style", mode="after")
+    @classmethod
+    def validate_design_style(cls, v):
+        v_lower = v.lower()
+        if v_lower not in _VALID_STYLES:
+            raise ValueError("Design style must be one of: modern, minimalistic, corporate, artistic")
+        return v_lower
+    
+    # Validate HEX color
+    @field_validator("primary_color", mode="after")
+    @classmethod
+    def validate_hex_color(cls, v):
+        # Plain length/prefix/charset checks, no regex needed for #RGB or #RRGGBB
+        if len(v) not in (4, 7) or v[0] != '#' or not all(c in _HEX_DIGITS for c in v[1:]):
+            raise ValueError("Primary color must be a valid HEX color (e.g., #FF5733 or #F57)")
+        return v.upper()
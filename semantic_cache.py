@@ -0,0 +1,216 @@
+import math
+import time
+import logging
+import operator
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import serialization
+from config import get_config
+from s3_uploader import get_s3_client
+
+logger = logging.getLogger(__name__)
+
+# Cosine similarity above which two brand briefs are treated as the same request
+SIMILARITY_THRESHOLD = 0.95
+CACHE_TTL_SECONDS = 24 * 60 * 60  # 24 hours
+CACHE_MAX_ENTRIES = 1024
+
+# Entries are also persisted to S3, one object per entry, so the index
+# survives restarts and is shared by all workers without write conflicts
+S3_PREFIX = "cache/semantic/"
+# Parallel GETs when loading the index (within the S3 client's pool)
+MAX_LOAD_WORKERS = 16
+
+# Entries are grouped into partitions that must match exactly (the caller
+# derives them from everything but the fuzzy-matched text, e.g. tone, style
+# and color), so similarity is only ever compared within one partition.
+# _entries: cache key -> (partition, stored_at, unit-length embedding, HTML),
+# oldest first; _partitions: partition -> {cache key: same entry}
+_entries: "OrderedDict[str, tuple]" = OrderedDict()
+_partitions: dict = {}
+# Guards both indexes: lookups run in worker threads and the S3 load in a
+# background thread, while inserts come from the event loop
+_lock = threading.Lock()
+_load_started = False
+
+
+def _normalize(embedding: list) -> list:
+    """
+    Scale an embedding to unit length so similarity is a plain dot product.
+    """
+    norm = math.sqrt(sum(x * x for x in embedding))
+    if norm == 0:
+        return list(embedding)
+    return [x / norm for x in embedding]
+
+
+def _remove(key: str) -> None:
+    """
+    Drop one entry from both indexes. Caller holds _lock.
+    """
+    partition = _entries.pop(key)[0]
+    members = _partitions[partition]
+    del members[key]
+    if not members:
+        del _partitions[partition]
+
+
+def _add(key: str, entry: tuple) -> None:
+    """
+    Add an entry to both indexes, evicting the oldest past the size limit.
+    Caller holds _lock.
+    """
+    if key in _entries:
+        _remove(key)
+    _entries[key] = entry
+    _partitions.setdefault(entry[0], {})[key] = entry
+    while len(_entries) > CACHE_MAX_ENTRIES:
+        _remove(next(iter(_entries)))
+
+
+def _evict_expired() -> None:
+    """
+    Drop entries older than the TTL. Caller holds _lock.
+    """
+    cutoff = time.time() - CACHE_TTL_SECONDS
+    while _entries:
+        key, entry = next(iter(_entries.items()))
+        if entry[1] >= cutoff:
+            break
+        _remove(key)
+
+
+def _load() -> None:
+    """
+    Fetch unexpired entries from S3 into the index and delete expired ones.
+    Failures leave the index as it was.
+    """
+    bucket = get_config().s3_bucket_name
+    if not bucket:
+        return
+
+    try:
+        s3_client = get_s3_client()
+        cutoff = time.time() - CACHE_TTL_SECONDS
+        paginator = s3_client.get_paginator('list_objects_v2')
+        live = []
+        expired = []
+        for page in paginator.paginate(Bucket=bucket, Prefix=S3_PREFIX):
+            for obj in page.get('Contents', []):
+                if obj['LastModified'].timestamp() >= cutoff:
+                    live.append(obj)
+                else:
+                    expired.append({'Key': obj['Key']})
+
+        # Expired entries would otherwise be listed on every cold start forever
+        for i in range(0, len(expired), 1000):
+            s3_client.delete_objects(Bucket=bucket, Delete={'Objects': expired[i:i + 1000], 'Quiet': True})
+
+        # Newest first, so the most recent entries win when the index is full
+        live.sort(key=lambda obj: obj['LastModified'], reverse=True)
+        live = live[:CACHE_MAX_ENTRIES]
+
+        def _fetch(obj):
+            return obj['Key'], serialization.loads(
+                s3_client.get_object(Bucket=bucket, Key=obj['Key'])['Body'].read()
+            )
+
+        loaded = []
+        if live:
+            with ThreadPoolExecutor(max_workers=min(MAX_LOAD_WORKERS, len(live))) as executor:
+                for s3_key, record in executor.map(_fetch, live):
+                    # Entries written before partitioning cannot be matched safely
+                    if record.get('partition') is None or record['stored_at'] < cutoff:
+                        continue
+                    key = s3_key[len(S3_PREFIX):].removesuffix('.json')
+                    loaded.append((key, (record['partition'], record['stored_at'], record['embedding'], record['html'])))
+
+        with _lock:
+            # Merge with entries inserted while loading, keeping age order
+            merged = sorted(list(_entries.items()) + loaded, key=lambda item: item[1][1])
+            _entries.clear()
+            _partitions.clear()
+            for key, entry in merged:
+                _add(key, entry)
+        logger.info("Loaded %d semantic cache entries from S3, deleted %d expired", len(loaded), len(expired))
+    except Exception as e:
+        logger.warning("Could not load semantic cache from S3: %s", e)
+
+
+def start_loading() -> None:
+    """
+    Populate the index from S3 in a background thread, once per process.
+    Lookups made before it finishes only see entries inserted locally.
+    """
+    global _load_started
+    with _lock:
+        if _load_started:
+            return
+        _load_started = True
+    threading.Thread(target=_load, name="semantic-cache-load", daemon=True).start()
+
+
+def lookup(partition: str, embedding: list, threshold: float = SIMILARITY_THRESHOLD):
+    """
+    Return the cached HTML of the most similar stored brief in the same
+    partition, or None if none reaches the similarity threshold. CPU-bound;
+    call it from a worker thread.
+    """
+    query = _normalize(embedding)
+    best_score = -1.0
+    best_html = None
+    with _lock:
+        _evict_expired()
+        for _, _, vector, html_content in _partitions.get(partition, {}).values():
+            score = sum(map(operator.mul, query, vector))
+            if score > best_score:
+                best_score = score
+                best_html = html_content
+
+    if best_score >= threshold:
+        return best_html
+    return None
+
+
+def insert(partition: str, key: str, embedding: list, html_content: str):
+    """
+    Store the cleaned HTML generated for an embedding in the in-process index.
+    Returns the stored entry so it can be handed to persist().
+    """
+    entry = (partition, time.time(), _normalize(embedding), html_content)
+    with _lock:
+        _add(key, entry)
+    return entry
+
+
+def persist(key: str, entry) -> None:
+    """
+    Write an entry to S3 under its cache key. Blocking; call it from a worker
+    thread. Failures are logged, never raised.
+    """
+    bucket = get_config().s3_bucket_name
+    if not bucket:
+        return
+    partition, stored_at, vector, html_content = entry
+    try:
+        get_s3_client().put_object(
+            Bucket=bucket,
+            Key=f"{S3_PREFIX}{key}.json",
+            Body=serialization.dumps({
+                "partition": partition,
+                "stored_at": stored_at,
+                "embedding": vector,
+                "html": html_content
+            }),
+            ContentType='application/json'
+        )
+    except Exception as e:
+        logger.warning("S3 semantic cache write failed: %s", e)
+
+
+def size() -> int:
+    """
+    Number of entries currently stored.
+    """
+    return len(_entries)
@@ -0,0 +1,27 @@
+import json
+
+# orjson is several times faster than the stdlib for the cache-key and cache
+# entry payloads. The fallback is formatted the same way (compact, unescaped
+# UTF-8), so string-only cache keys do not depend on which one is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj, sort_keys: bool = False) -> bytes:
+    """
+    Serialize to compact UTF-8 JSON bytes, optionally with sorted keys.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(obj, sort_keys=sort_keys, separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+
+
+def loads(data):
+    """
+    Parse JSON from bytes or str.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)